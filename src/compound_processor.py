@@ -1,11 +1,47 @@
 import pandas as pd
 import numpy as np
+from numba import njit, prange
+import pyarrow as pa
+import pyarrow.parquet as pq
+import orjson
 from datetime import datetime, timedelta
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 import logging
+import os
 
 logger = logging.getLogger(__name__)
 
+# Fixed category order for the compound_action column
+COMPOUND_ACTIONS = [
+    'mint', 'redeem', 'redeemUnderlying', 'borrow', 'repayBorrow', 'repayBorrowBehalf',
+    'liquidateBorrow', 'enterMarkets', 'exitMarket', 'supply_eth', 'interact', 'unknown'
+]
+
+@njit(parallel=True, cache=True)
+def _wallet_interval_stats(ts, starts, ends, out_mean, out_std):
+    """
+    Mean and sample std of the hours between consecutive transactions,
+    one streaming (Welford) pass per wallet over sorted timestamps
+    """
+    for g in prange(len(starts)):
+        s, e = starts[g], ends[g]
+        n = e - s - 1
+        if n <= 0:
+            out_mean[g] = 0.0
+            out_std[g] = 0.0
+            continue
+        m = 0.0
+        m2 = 0.0
+        for i in range(s + 1, e):
+            d = (ts[i] - ts[i - 1]) / 3600.0
+            k = i - s
+            delta = d - m
+            m += delta / k
+            m2 += delta * (d - m)
+        out_mean[g] = m
+        # Match pandas: the sample std of a single interval is undefined
+        out_std[g] = np.sqrt(m2 / (n - 1)) if n > 1 else np.nan
+
 class CompoundDataProcessor:
     """
     Process raw Compound transaction data into structured format
@@ -26,196 +62,306 @@ class CompoundDataProcessor:
         """
         logger.info("Processing wallet transaction data")
         
-        all_transactions = []
+        # Accumulate column-wise instead of building a dict per transaction
+        wallet_addr, tx_hash, block_number, timestamp = [], [], [], []
+        from_addr, to_addr, value_strs, gas_used_strs, gas_price_strs = [], [], [], [], []
+        compound_action, is_error, tx_type = [], [], []
+        token_decimal, token_symbol, token_address = [], [], []
         
         for wallet in wallet_data:
             address = wallet['address']
             transactions = wallet.get('transactions', [])
             
             for tx in transactions:
-                processed_tx = {
-                    'wallet_address': address,
-                    'tx_hash': tx.get('hash', ''),
-                    'block_number': int(tx.get('blockNumber', 0)),
-                    'timestamp': int(tx.get('timeStamp', 0)),
-                    'from_address': tx.get('from', '').lower(),
-                    'to_address': tx.get('to', '').lower(),
-                    'value': float(tx.get('value', 0)) / 1e18,  # Convert from Wei
-                    'gas_used': int(tx.get('gasUsed', 0)),
-                    'gas_price': int(tx.get('gasPrice', 0)),
-                    'tx_fee': (int(tx.get('gasUsed', 0)) * int(tx.get('gasPrice', 0))) / 1e18,
-                    'compound_action': tx.get('compound_action', 'unknown'),
-                    'is_error': int(tx.get('isError', 0)),
-                    'tx_type': tx.get('type', 'regular')
-                }
+                wallet_addr.append(address)
+                tx_hash.append(tx.get('hash', ''))
+                block_number.append(int(tx.get('blockNumber', 0)))
+                timestamp.append(int(tx.get('timeStamp', 0)))
+                from_addr.append(tx.get('from', '').lower())
+                to_addr.append(tx.get('to', '').lower())
+                value_strs.append(tx.get('value', 0))
+                gas_used_strs.append(tx.get('gasUsed', 0))
+                gas_price_strs.append(tx.get('gasPrice', 0))
+                compound_action.append(tx.get('compound_action', 'unknown'))
+                is_error.append(int(tx.get('isError', 0)))
+                tx_type.append(tx.get('type', 'regular'))
                 
                 # Handle token transactions
                 if tx.get('type') == 'token':
-                    token_decimal = int(tx.get('tokenDecimal', 18))
-                    processed_tx['token_value'] = float(tx.get('value', 0)) / (10 ** token_decimal)
-                    processed_tx['token_symbol'] = tx.get('tokenSymbol', '')
-                    processed_tx['token_address'] = tx.get('contractAddress', '').lower()
-                
-                all_transactions.append(processed_tx)
+                    token_decimal.append(tx.get('tokenDecimal', 18))
+                    token_symbol.append(tx.get('tokenSymbol', ''))
+                    token_address.append(tx.get('contractAddress', '').lower())
+                else:
+                    token_decimal.append(0)
+                    token_symbol.append(np.nan)
+                    token_address.append(np.nan)
+        
+        # Convert raw API strings in one pass per column; Wei values can exceed
+        # int64, so they go through Python int straight into float64
+        n = len(value_strs)
+        value_raw = np.fromiter((int(v) for v in value_strs), dtype=np.float64, count=n)
+        gas_used_arr = np.fromiter((int(g) for g in gas_used_strs), dtype=np.int64, count=n)
+        gas_price_arr = np.fromiter((int(g) for g in gas_price_strs), dtype=np.int64, count=n)
+        # ERC-20 decimals are a uint8; int16 leaves headroom for malformed values
+        token_decimal_arr = np.fromiter((int(d) for d in token_decimal), dtype=np.int16, count=n)
+        is_token = np.asarray(tx_type, dtype=object) == 'token'
         
-        df = pd.DataFrame(all_transactions)
+        value_arr = value_raw / 1e18  # Convert from Wei
+        tx_fee_arr = (gas_used_arr.astype(np.float64) * gas_price_arr.astype(np.float64)) / 1e18
+        token_value_arr = np.where(is_token, value_raw / np.power(10.0, token_decimal_arr), np.nan)
+        
+        # Keep any action outside the known set so nothing is mapped to NaN
+        extra_actions = [a for a in pd.unique(np.asarray(compound_action, dtype=object))
+                         if a not in COMPOUND_ACTIONS]
+        
+        # Repetitive string columns are stored as categoricals (integer codes)
+        df = pd.DataFrame({
+            'wallet_address': pd.Categorical(wallet_addr),
+            'tx_hash': pd.Series(tx_hash, dtype=object),
+            'block_number': np.asarray(block_number, dtype=np.uint32),
+            'timestamp': np.asarray(timestamp, dtype=np.int64),
+            'from_address': pd.Categorical(from_addr),
+            'to_address': pd.Categorical(to_addr),
+            'value': value_arr,
+            'gas_used': gas_used_arr.astype(np.uint32),
+            'gas_price': gas_price_arr,
+            'tx_fee': tx_fee_arr,
+            'compound_action': pd.Categorical(compound_action, categories=COMPOUND_ACTIONS + extra_actions),
+            'is_error': np.asarray(is_error, dtype=np.uint8),
+            'tx_type': pd.Categorical(tx_type),
+            'token_value': token_value_arr,
+            'token_symbol': pd.Categorical(token_symbol),
+            'token_address': pd.Categorical(token_address)
+        })
         
         if len(df) > 0:
-            # Convert timestamp to datetime
-            df['datetime'] = pd.to_datetime(df['timestamp'], unit='s')
-            df['date'] = df['datetime'].dt.date
-            df['hour'] = df['datetime'].dt.hour
-            df['day_of_week'] = df['datetime'].dt.dayofweek
-            
-            # Sort by timestamp
-            df = df.sort_values(['wallet_address', 'timestamp'])
+            # Calendar fields straight from the UTC epoch seconds
+            ts = df['timestamp'].to_numpy(dtype=np.int64)
+            days = ts // 86400
+            df['date_ord'] = days.astype(np.int32)  # days since 1970-01-01
+            df['hour'] = ((ts // 3600) % 24).astype(np.int8)
+            df['day_of_week'] = ((days + 3) % 7).astype(np.int8)  # Monday=0; the epoch was a Thursday
             
             logger.info(f"Processed {len(df)} transactions for {df['wallet_address'].nunique()} wallets")
         
         self.processed_data = df
         return df
     
-    def calculate_wallet_metrics(self, df: pd.DataFrame) -> pd.DataFrame:
+    def save_processed(self, df: pd.DataFrame, output_path: str, wallet_addresses: List[str]):
         """
-        Calculate comprehensive metrics for each wallet
+        Save processed transaction data to Parquet
         
         Args:
             df (pd.DataFrame): Processed transaction data
+            output_path (str): Output file path
+            wallet_addresses (List[str]): Wallets the data was built for, stored
+                in the file metadata so load_processed can check coverage
+        """
+        # Written to a temp file and swapped in, so an interrupted write never
+        # leaves a truncated cache behind
+        tmp_path = f"{output_path}.tmp"
+        try:
+            table = pa.Table.from_pandas(df)
+            metadata = dict(table.schema.metadata or {})
+            metadata[b'wallet_addresses'] = orjson.dumps(sorted({address.lower() for address in wallet_addresses}))
+            pq.write_table(table.replace_schema_metadata(metadata), tmp_path, compression='zstd')
+            os.replace(tmp_path, output_path)
+            logger.info(f"Processed data saved to {output_path}")
+        except Exception as e:
+            logger.error(f"Error saving processed data: {str(e)}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    
+    def load_processed(self, file_path: str, wallet_addresses: List[str]) -> Optional[pd.DataFrame]:
+        """
+        Load processed transaction data saved by save_processed
+        
+        Args:
+            file_path (str): Path to Parquet file
+            wallet_addresses (List[str]): Wallets the caller needs
             
         Returns:
-            pd.DataFrame: Wallet metrics
+            Optional[pd.DataFrame]: Processed transaction data, or None when the
+                file is unreadable or was built for a different wallet set
         """
-        logger.info("Calculating wallet metrics")
-        
-        if len(df) == 0:
-            return pd.DataFrame()
-        
-        wallet_metrics = []
+        try:
+            stored = (pq.read_schema(file_path).metadata or {}).get(b'wallet_addresses')
+            if stored is None or set(orjson.loads(stored)) != {address.lower() for address in wallet_addresses}:
+                logger.info(f"Processed data in {file_path} covers a different wallet set, ignoring it")
+                return None
+            
+            df = pd.read_parquet(file_path, engine='pyarrow')
+        except Exception as e:
+            logger.error(f"Error loading processed data from {file_path}: {str(e)}")
+            return None
         
-        for wallet_address, wallet_txs in df.groupby('wallet_address'):
-            metrics = self._calculate_single_wallet_metrics(wallet_address, wallet_txs)
-            wallet_metrics.append(metrics)
+        logger.info(f"Loaded {len(df)} processed transactions from {file_path}")
         
-        return pd.DataFrame(wallet_metrics)
+        self.processed_data = df
+        return df
     
-    def _calculate_single_wallet_metrics(self, address: str, txs: pd.DataFrame) -> Dict:
+    def calculate_wallet_metrics(self, df: pd.DataFrame) -> pd.DataFrame:
         """
-        Calculate metrics for a single wallet
+        Calculate comprehensive metrics for each wallet
         
         Args:
-            address (str): Wallet address
-            txs (pd.DataFrame): Wallet transactions
+            df (pd.DataFrame): Processed transaction data
             
         Returns:
-            Dict: Wallet metrics
+            pd.DataFrame: Wallet metrics
         """
-        metrics = {'wallet_address': address}
+        logger.info("Calculating wallet metrics")
+        
+        if len(df) == 0:
+            return pd.DataFrame()
+        
+        is_error = df['is_error'].to_numpy()
+        ok_mask = is_error == 0
+        hour = df['hour'].to_numpy()
+        
+        # Narrow frame holding only the grouped columns and per-row helpers, so
+        # the full transaction frame (hashes, addresses, tokens) is not copied
+        txs = pd.DataFrame({
+            'wallet_address': df['wallet_address'].array,
+            'timestamp': df['timestamp'].to_numpy(),
+            'compound_action': df['compound_action'].array,
+            'is_ok': ok_mask.astype(int),
+            # Successful-only amounts, so financial sums need no per-group filtering
+            'tx_fee_ok': np.where(ok_mask, df['tx_fee'].to_numpy(), 0.0),
+            'value_ok': np.where(ok_mask, df['value'].to_numpy(), 0.0),
+            'is_failed': (is_error == 1).astype(int),
+            # Weekend/night activity (potential bot indicators)
+            'is_weekend': np.isin(df['day_of_week'].to_numpy(), [5, 6]).astype(int),
+            'is_night': ((hour >= 0) & (hour <= 6)).astype(int)
+        }, copy=False)
+        g = txs.groupby('wallet_address', sort=False, observed=True)
         
         # Basic transaction metrics
-        metrics['total_transactions'] = len(txs)
-        metrics['successful_transactions'] = len(txs[txs['is_error'] == 0])
-        metrics['failed_transactions'] = len(txs[txs['is_error'] == 1])
-        metrics['success_rate'] = metrics['successful_transactions'] / max(metrics['total_transactions'], 1)
+        metrics = g.agg(
+            total_transactions=('timestamp', 'size'),
+            successful_transactions=('is_ok', 'sum'),
+            failed_transactions=('is_failed', 'sum'),
+            first_tx_date=('timestamp', 'min'),
+            last_tx_date=('timestamp', 'max'),
+            total_gas_spent=('tx_fee_ok', 'sum'),
+            total_eth_value=('value_ok', 'sum'),
+            action_diversity=('compound_action', 'nunique'),
+            weekend_txs=('is_weekend', 'sum'),
+            night_txs=('is_night', 'sum')
+        )
+        total = metrics['total_transactions']
+        metrics['success_rate'] = metrics['successful_transactions'] / total.clip(lower=1)
         
         # Time-based metrics
-        if len(txs) > 0:
-            metrics['first_tx_date'] = txs['timestamp'].min()
-            metrics['last_tx_date'] = txs['timestamp'].max()
-            metrics['account_age_days'] = (metrics['last_tx_date'] - metrics['first_tx_date']) / 86400
-            metrics['avg_tx_interval_days'] = metrics['account_age_days'] / max(metrics['total_transactions'] - 1, 1)
-        else:
-            metrics['first_tx_date'] = 0
-            metrics['last_tx_date'] = 0
-            metrics['account_age_days'] = 0
-            metrics['avg_tx_interval_days'] = 0
+        metrics['account_age_days'] = (metrics['last_tx_date'] - metrics['first_tx_date']) / 86400
+        metrics['avg_tx_interval_days'] = metrics['account_age_days'] / (total - 1).clip(lower=1)
         
         # Action-based metrics
-        action_counts = txs['compound_action'].value_counts()
-        for action in ['mint', 'redeem', 'redeemUnderlying', 'borrow', 'repayBorrow', 'liquidateBorrow']:
-            metrics[f'{action}_count'] = action_counts.get(action, 0)
+        actions = ['mint', 'redeem', 'redeemUnderlying', 'borrow', 'repayBorrow', 'liquidateBorrow']
+        action_counts = pd.crosstab(txs['wallet_address'], txs['compound_action']).reindex(
+            index=metrics.index, columns=actions, fill_value=0
+        )
+        for action in actions:
+            metrics[f'{action}_count'] = action_counts[action]
         
         # Calculate action ratios
-        total_actions = sum([metrics[f'{action}_count'] for action in ['mint', 'redeem', 'redeemUnderlying', 'borrow', 'repayBorrow']])
-        
-        if total_actions > 0:
-            metrics['supply_ratio'] = (metrics['mint_count']) / total_actions
-            metrics['withdraw_ratio'] = (metrics['redeem_count'] + metrics['redeemUnderlying_count']) / total_actions
-            metrics['borrow_ratio'] = metrics['borrow_count'] / total_actions
-            metrics['repay_ratio'] = metrics['repayBorrow_count'] / total_actions
-        else:
-            metrics['supply_ratio'] = 0
-            metrics['withdraw_ratio'] = 0
-            metrics['borrow_ratio'] = 0
-            metrics['repay_ratio'] = 0
+        total_actions = action_counts[['mint', 'redeem', 'redeemUnderlying', 'borrow', 'repayBorrow']].sum(axis=1)
+        denom = total_actions.where(total_actions > 0)
+        metrics['supply_ratio'] = (metrics['mint_count'] / denom).fillna(0)
+        metrics['withdraw_ratio'] = ((metrics['redeem_count'] + metrics['redeemUnderlying_count']) / denom).fillna(0)
+        metrics['borrow_ratio'] = (metrics['borrow_count'] / denom).fillna(0)
+        metrics['repay_ratio'] = (metrics['repayBorrow_count'] / denom).fillna(0)
         
         # Liquidation risk
         metrics['liquidation_count'] = metrics['liquidateBorrow_count']
-        metrics['has_liquidations'] = 1 if metrics['liquidation_count'] > 0 else 0
-        metrics['liquidation_rate'] = metrics['liquidation_count'] / max(metrics['total_transactions'], 1)
-        
-        # Financial metrics
-        successful_txs = txs[txs['is_error'] == 0]
-        if len(successful_txs) > 0:
-            metrics['total_gas_spent'] = successful_txs['tx_fee'].sum()
-            metrics['avg_gas_per_tx'] = successful_txs['tx_fee'].mean()
-            metrics['total_eth_value'] = successful_txs['value'].sum()
-            metrics['avg_eth_per_tx'] = successful_txs['value'].mean()
-        else:
-            metrics['total_gas_spent'] = 0
-            metrics['avg_gas_per_tx'] = 0
-            metrics['total_eth_value'] = 0
-            metrics['avg_eth_per_tx'] = 0
-        
-        # Behavioral patterns
-        if len(txs) > 1:
-            # Time between transactions (in hours)
-            time_diffs = txs['timestamp'].diff().dropna() / 3600
-            metrics['avg_time_between_txs'] = time_diffs.mean()
-            metrics['std_time_between_txs'] = time_diffs.std()
-            
-            # Activity regularity (lower CV = more regular)
-            if time_diffs.mean() > 0:
-                metrics['activity_regularity'] = time_diffs.std() / time_diffs.mean()
-            else:
-                metrics['activity_regularity'] = 0
-        else:
-            metrics['avg_time_between_txs'] = 0
-            metrics['std_time_between_txs'] = 0
-            metrics['activity_regularity'] = 0
-        
-        # Diversification metrics
-        unique_actions = txs['compound_action'].nunique()
-        metrics['action_diversity'] = unique_actions
-        
-        # Weekend/night activity (potential bot indicators)
-        if 'day_of_week' in txs.columns:
-            weekend_txs = txs[txs['day_of_week'].isin([5, 6])]
-            metrics['weekend_activity_ratio'] = len(weekend_txs) / max(len(txs), 1)
-        else:
-            metrics['weekend_activity_ratio'] = 0
-        
-        if 'hour' in txs.columns:
-            night_txs = txs[(txs['hour'] >= 0) & (txs['hour'] <= 6)]
-            metrics['night_activity_ratio'] = len(night_txs) / max(len(txs), 1)
-        else:
-            metrics['night_activity_ratio'] = 0
+        metrics['has_liquidations'] = (metrics['liquidation_count'] > 0).astype(int)
+        metrics['liquidation_rate'] = metrics['liquidation_count'] / total.clip(lower=1)
+        
+        # Financial metrics (successful transactions only)
+        successful = metrics['successful_transactions'].clip(lower=1)
+        metrics['avg_gas_per_tx'] = metrics['total_gas_spent'] / successful
+        metrics['avg_eth_per_tx'] = metrics['total_eth_value'] / successful
+        
+        # Behavioral patterns: time between transactions (in hours). Only the
+        # timestamp and wallet code arrays are put in (wallet, timestamp)
+        # order, so each wallet becomes a contiguous run for the kernel
+        codes, uniques = pd.factorize(df['wallet_address'])
+        timestamps = df['timestamp'].to_numpy(dtype=np.int64)
+        order = np.lexsort((timestamps, codes))
+        ts_sorted = timestamps[order]
+        codes_sorted = codes[order]
+        starts = np.flatnonzero(np.diff(codes_sorted, prepend=-1) != 0)
+        ends = np.append(starts[1:], len(codes_sorted))
+        out_mean = np.empty(len(starts))
+        out_std = np.empty(len(starts))
+        _wallet_interval_stats(ts_sorted, starts, ends, out_mean, out_std)
+        mean_diff = pd.Series(out_mean, index=uniques).reindex(metrics.index)
+        metrics['avg_time_between_txs'] = mean_diff
+        metrics['std_time_between_txs'] = pd.Series(out_std, index=uniques).reindex(metrics.index)
+        
+        # Activity regularity (lower CV = more regular)
+        metrics['activity_regularity'] = (
+            metrics['std_time_between_txs'] / mean_diff.where(mean_diff > 0)
+        ).where(mean_diff > 0, 0)
+        
+        metrics['weekend_activity_ratio'] = metrics['weekend_txs'] / total.clip(lower=1)
+        metrics['night_activity_ratio'] = metrics['night_txs'] / total.clip(lower=1)
         
         # Risk indicators
-        metrics['repay_to_borrow_ratio'] = metrics['repayBorrow_count'] / max(metrics['borrow_count'], 1)
+        metrics['repay_to_borrow_ratio'] = metrics['repayBorrow_count'] / metrics['borrow_count'].clip(lower=1)
         
-        # High-frequency activity (potential bot behavior)
-        if len(txs) > 0:
-            daily_tx_counts = txs.groupby('date').size()
-            metrics['max_daily_transactions'] = daily_tx_counts.max()
-            metrics['avg_daily_transactions'] = daily_tx_counts.mean()
-            
-            if len(daily_tx_counts) > 1:
-                metrics['daily_activity_variance'] = daily_tx_counts.var()
-            else:
-                metrics['daily_activity_variance'] = 0
-        else:
-            metrics['max_daily_transactions'] = 0
-            metrics['avg_daily_transactions'] = 0
-            metrics['daily_activity_variance'] = 0
-        
-        return metrics
+        # High-frequency activity (potential bot behavior): count transactions
+        # per (wallet, day) pair via a packed integer key, then reduce per wallet
+        n_wallets = len(uniques)
+        pair_key = (codes.astype(np.int64) << 32) | df['date_ord'].to_numpy(dtype=np.int64)
+        pair_codes, pair_keys = pd.factorize(pair_key)
+        daily_tx_counts = np.bincount(pair_codes)
+        pair_wallet = pair_keys >> 32
+        
+        active_days = np.bincount(pair_wallet, minlength=n_wallets)
+        count_sum = np.bincount(pair_wallet, weights=daily_tx_counts, minlength=n_wallets)
+        count_sq_sum = np.bincount(pair_wallet, weights=daily_tx_counts.astype(np.float64) ** 2,
+                                   minlength=n_wallets)
+        max_daily = np.zeros(n_wallets, dtype=np.int64)
+        np.maximum.at(max_daily, pair_wallet, daily_tx_counts)
+        
+        # Sample variance across active days; a single active day has none
+        multi_day = active_days > 1
+        daily_variance = np.zeros(n_wallets)
+        daily_variance[multi_day] = (
+            count_sq_sum[multi_day] - count_sum[multi_day] ** 2 / active_days[multi_day]
+        ) / (active_days[multi_day] - 1)
+        
+        daily = pd.DataFrame({
+            'max_daily_transactions': max_daily,
+            'avg_daily_transactions': count_sum / active_days,
+            'daily_activity_variance': daily_variance
+        }, index=uniques)
+        metrics = metrics.join(daily)
+        
+        columns = [
+            'total_transactions', 'successful_transactions', 'failed_transactions', 'success_rate',
+            'first_tx_date', 'last_tx_date', 'account_age_days', 'avg_tx_interval_days',
+            *[f'{action}_count' for action in actions],
+            'supply_ratio', 'withdraw_ratio', 'borrow_ratio', 'repay_ratio',
+            'liquidation_count', 'has_liquidations', 'liquidation_rate',
+            'total_gas_spent', 'avg_gas_per_tx', 'total_eth_value', 'avg_eth_per_tx',
+            'avg_time_between_txs', 'std_time_between_txs', 'activity_regularity',
+            'action_diversity', 'weekend_activity_ratio', 'night_activity_ratio',
+            'repay_to_borrow_ratio', 'max_daily_transactions', 'avg_daily_transactions',
+            'daily_activity_variance'
+        ]
+        
+        # Counts fit in int32; ratios stay float64 since they feed the scores
+        count_columns = [
+            'total_transactions', 'successful_transactions', 'failed_transactions',
+            *[f'{action}_count' for action in actions],
+            'liquidation_count', 'action_diversity', 'max_daily_transactions'
+        ]
+        metrics = metrics[columns].astype({
+            **{col: np.int32 for col in count_columns},
+            'has_liquidations': np.bool_
+        })
+        
+        # Report wallets in address order
+        return metrics.sort_index().reset_index()
@@ -1,14 +1,13 @@
 import asyncio
 import aiohttp
-import requests
+from aiolimiter import AsyncLimiter
 import pandas as pd
 import numpy as np
 from web3 import Web3
 from datetime import datetime, timedelta
 import logging
-import time
 from typing import List, Dict, Optional
-import json
+import orjson
 import os
 from dotenv import load_dotenv
 
@@ -16,6 +15,35 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Common Compound method signatures, keyed by 4-byte selector
+SIG_TABLE: Dict[int, str] = {
+    0xa0712d68: 'mint',  # mint()
+    0x1249c58b: 'mint',  # mint()
+    0x6c540baf: 'mint',  # mint(uint256)
+    0xdb006a75: 'redeem',  # redeem(uint256)
+    0x852a12e3: 'redeemUnderlying',  # redeemUnderlying(uint256)
+    0xc5ebeaec: 'borrow',  # borrow(uint256)
+    0x0e752702: 'repayBorrow',  # repayBorrow(uint256)
+    0x4e4d9fea: 'repayBorrow',  # repayBorrow()
+    0x2608f818: 'repayBorrowBehalf',  # repayBorrowBehalf(address,uint256)
+    0x47ef3b3b: 'liquidateBorrow',  # liquidateBorrow(address,uint256,address)
+    0x317b0b77: 'enterMarkets',  # enterMarkets(address[])
+    0xede4edd0: 'exitMarket',  # exitMarket(address)
+}
+
+# Sorted selector/action arrays for vectorized lookup with np.searchsorted
+_SIG_KEYS = np.array(sorted(SIG_TABLE), dtype=np.uint32)
+_SIG_VALS = np.array([SIG_TABLE[int(key)] for key in _SIG_KEYS], dtype=object)
+
+def _parse_selector(input_data: str) -> int:
+    """Parse the 4-byte method selector from transaction input (0 if absent)"""
+    if len(input_data) < 10 or not input_data.startswith('0x'):
+        return 0
+    try:
+        return int(input_data[2:10], 16)
+    except ValueError:
+        return 0
+
 class CompoundDataFetcher:
     """
     Fetch transaction data from Compound V2/V3 protocol
@@ -49,10 +77,49 @@ class CompoundDataFetcher:
             'ceth_v3': '0xa17581a9e3356d9a858b789d68b4d866e593ae94'
         }
         
+        # Lowercase and EIP-55 checksummed forms, so filtering matches either
+        # without normalising every transaction's addresses
+        compound_addresses = list(self.compound_v2_contracts.values()) + list(self.compound_v3_contracts.values())
+        self._compound_addr_set = frozenset(
+            [addr.lower() for addr in compound_addresses] +
+            [Web3.to_checksum_address(addr) for addr in compound_addresses]
+        )
+        
         # API endpoints
         self.etherscan_api_key = os.getenv('ETHERSCAN_API_KEY', '')
         self.etherscan_base_url = "https://api.etherscan.io/api"
         
+        # Etherscan free tier allows 5 requests per second
+        self.rate_limiter = AsyncLimiter(5, 1)
+        
+        # Shared HTTP session (created on first use) and retry policy
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.max_retries = 3
+        self.retry_backoff = 0.3
+        self.retry_statuses = {429, 502, 503, 504}
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+    
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Return the shared keep-alive HTTP session, creating it if needed"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=20, limit_per_host=10),
+                timeout=aiohttp.ClientTimeout(total=30),
+                headers={'User-Agent': 'compound-risk/1.0'}
+            )
+        return self._session
+    
+    async def close(self):
+        """Close the shared HTTP session"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        
     def _initialize_web3(self):
         """Initialize Web3 connection with fallback RPCs"""
         for rpc_url in self.rpc_urls:
@@ -68,10 +135,13 @@ class CompoundDataFetcher:
         if not self.w3 or not self.w3.is_connected():
             logger.warning("No RPC connection available, using API fallback")
     
-    def fetch_etherscan_transactions(self, address: str, start_block: int = 0) -> List[Dict]:
+    async def fetch_etherscan_transactions(self, address: str, start_block: int = 0) -> List[Dict]:
         """
         Fetch transactions using Etherscan API
         
+        The regular, internal and token transfer lists are requested
+        concurrently.
+        
         Args:
             address (str): Wallet address
             start_block (int): Starting block number
@@ -79,12 +149,8 @@ class CompoundDataFetcher:
         Returns:
             List[Dict]: Transaction data
         """
-        transactions = []
-        
-        # Regular transactions
         params = {
             'module': 'account',
-            'action': 'txlist',
             'address': address,
             'startblock': start_block,
             'endblock': 'latest',
@@ -94,45 +160,64 @@ class CompoundDataFetcher:
             'apikey': self.etherscan_api_key
         }
         
-        try:
-            response = requests.get(self.etherscan_base_url, params=params, timeout=30)
-            data = response.json()
-            
-            if data['status'] == '1':
-                transactions.extend(data['result'])
-                logger.info(f"Fetched {len(data['result'])} regular transactions for {address}")
-            
+        regular_txs, internal_txs, token_txs = await asyncio.gather(
+            # Regular transactions
+            self._fetch_etherscan_action({**params, 'action': 'txlist'}, address),
             # Internal transactions
-            params['action'] = 'txlistinternal'
-            response = requests.get(self.etherscan_base_url, params=params, timeout=30)
-            data = response.json()
-            
-            if data['status'] == '1':
-                internal_txs = data['result']
-                for tx in internal_txs:
-                    tx['type'] = 'internal'
-                transactions.extend(internal_txs)
-                logger.info(f"Fetched {len(internal_txs)} internal transactions for {address}")
-            
+            self._fetch_etherscan_action({**params, 'action': 'txlistinternal'}, address),
             # ERC-20 token transfers
-            params['action'] = 'tokentx'
-            response = requests.get(self.etherscan_base_url, params=params, timeout=30)
-            data = response.json()
-            
-            if data['status'] == '1':
-                token_txs = data['result']
-                for tx in token_txs:
-                    tx['type'] = 'token'
-                transactions.extend(token_txs)
-                logger.info(f"Fetched {len(token_txs)} token transactions for {address}")
+            self._fetch_etherscan_action({**params, 'action': 'tokentx'}, address)
+        )
+        
+        for tx in internal_txs:
+            tx['type'] = 'internal'
+        for tx in token_txs:
+            tx['type'] = 'token'
+        
+        logger.info(f"Fetched {len(regular_txs)} regular, {len(internal_txs)} internal and "
+                    f"{len(token_txs)} token transactions for {address}")
+        
+        return regular_txs + internal_txs + token_txs
+    
+    async def _fetch_etherscan_action(self, params: Dict, address: str) -> List[Dict]:
+        """
+        Fetch a single Etherscan account list, respecting the API rate limit
+        
+        Throttled (429) and gateway (502-504) responses and connection errors
+        are retried with exponential backoff.
+        
+        Args:
+            params (Dict): Query parameters
+            address (str): Wallet address
             
-        except Exception as e:
-            logger.error(f"Error fetching transactions for {address}: {str(e)}")
+        Returns:
+            List[Dict]: Transaction data (empty on error)
+        """
+        session = self._get_session()
         
-        # Add delay to respect rate limits
-        time.sleep(0.2)
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self.rate_limiter:
+                    async with session.get(self.etherscan_base_url, params=params) as response:
+                        if response.status in self.retry_statuses:
+                            raise aiohttp.ClientResponseError(
+                                response.request_info, response.history, status=response.status
+                            )
+                        data = orjson.loads(await response.read())
+                
+                return data['result'] if data['status'] == '1' else []
+            
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt == self.max_retries:
+                    logger.error(f"Error fetching {params['action']} for {address}: {str(e)}")
+                    return []
+                await asyncio.sleep(self.retry_backoff * 2 ** attempt)
+            
+            except Exception as e:
+                logger.error(f"Error fetching {params['action']} for {address}: {str(e)}")
+                return []
         
-        return transactions
+        return []
     
     def filter_compound_transactions(self, transactions: List[Dict], wallet_address: str) -> List[Dict]:
         """
@@ -145,72 +230,52 @@ class CompoundDataFetcher:
         Returns:
             List[Dict]: Compound-related transactions
         """
-        compound_addresses = set(list(self.compound_v2_contracts.values()) + 
-                               list(self.compound_v3_contracts.values()))
+        # Check if transaction involves Compound contracts (lowercase or checksummed)
+        involves_compound = np.zeros(len(transactions), dtype=bool)
+        for key in ('to', 'from', 'contractAddress'):
+            addresses = pd.Series([tx.get(key) or '' for tx in transactions], dtype=object)
+            involves_compound |= addresses.isin(self._compound_addr_set).to_numpy()
         
-        compound_txs = []
+        compound_txs = [tx for tx, hit in zip(transactions, involves_compound) if hit]
         
-        for tx in transactions:
-            to_address = tx.get('to', '').lower()
-            from_address = tx.get('from', '').lower()
-            contract_address = tx.get('contractAddress', '').lower()
-            
-            # Check if transaction involves Compound contracts
-            if (to_address in [addr.lower() for addr in compound_addresses] or
-                from_address in [addr.lower() for addr in compound_addresses] or
-                contract_address in [addr.lower() for addr in compound_addresses]):
-                
-                # Add transaction type based on method signature
-                input_data = tx.get('input', '')
-                tx['compound_action'] = self._classify_compound_action(input_data, tx)
-                tx['wallet_address'] = wallet_address.lower()
-                compound_txs.append(tx)
+        # Add transaction type based on method signature
+        actions = self._classify_compound_actions(compound_txs)
+        for tx, action in zip(compound_txs, actions):
+            tx['compound_action'] = action
+            tx['wallet_address'] = wallet_address.lower()
         
         logger.info(f"Found {len(compound_txs)} Compound transactions for {wallet_address}")
         return compound_txs
     
-    def _classify_compound_action(self, input_data: str, tx: Dict) -> str:
+    def _classify_compound_actions(self, transactions: List[Dict]) -> List[str]:
         """
-        Classify Compound transaction action based on method signature
+        Classify Compound transaction actions based on method signature
         
         Args:
-            input_data (str): Transaction input data
-            tx (Dict): Transaction data
+            transactions (List[Dict]): Transaction data
             
         Returns:
-            str: Action type
+            List[str]: Action type per transaction
         """
-        if not input_data or input_data == '0x':
-            return 'unknown'
-        
-        # Common Compound method signatures
-        method_signatures = {
-            '0xa0712d68': 'mint',  # mint()
-            '0x1249c58b': 'mint',  # mint()
-            '0x6c540baf': 'mint',  # mint(uint256)
-            '0xdb006a75': 'redeem',  # redeem(uint256)
-            '0x852a12e3': 'redeemUnderlying',  # redeemUnderlying(uint256)
-            '0xc5ebeaec': 'borrow',  # borrow(uint256)
-            '0x0e752702': 'repayBorrow',  # repayBorrow(uint256)
-            '0x4e4d9fea': 'repayBorrow',  # repayBorrow()
-            '0x2608f818': 'repayBorrowBehalf',  # repayBorrowBehalf(address,uint256)
-            '0x47ef3b3b': 'liquidateBorrow',  # liquidateBorrow(address,uint256,address)
-            '0x317b0b77': 'enterMarkets',  # enterMarkets(address[])
-            '0xede4edd0': 'exitMarket',  # exitMarket(address)
-        }
-        
-        method_sig = input_data[:10]
-        action = method_signatures.get(method_sig, 'unknown')
-        
-        # Additional classification based on value and to/from addresses
-        if action == 'unknown':
-            value = int(tx.get('value', '0'))
-            if value > 0:
-                action = 'supply_eth'
-            else:
-                action = 'interact'
+        n = len(transactions)
+        if n == 0:
+            return []
         
-        return action
+        inputs = [tx.get('input', '') or '' for tx in transactions]
+        has_input = np.fromiter((i not in ('', '0x') for i in inputs), dtype=bool, count=n)
+        selectors = np.fromiter((_parse_selector(i) for i in inputs), dtype=np.uint32, count=n)
+        idx = np.minimum(np.searchsorted(_SIG_KEYS, selectors), len(_SIG_KEYS) - 1)
+        actions = np.where(_SIG_KEYS[idx] == selectors, _SIG_VALS[idx], 'unknown').astype(object)
+        
+        # Additional classification based on value for unrecognised calls
+        unknown = has_input & (actions == 'unknown')
+        if unknown.any():
+            has_value = np.array([int(tx.get('value', '0')) > 0 if u else False
+                                  for tx, u in zip(transactions, unknown)])
+            actions[unknown] = np.where(has_value[unknown], 'supply_eth', 'interact')
+        actions[~has_input] = 'unknown'
+        
+        return actions.tolist()
     
     async def fetch_wallet_data(self, wallet_address: str) -> Dict:
         """
@@ -225,7 +290,7 @@ class CompoundDataFetcher:
         logger.info(f"Fetching data for wallet: {wallet_address}")
         
         # Fetch all transactions
-        all_transactions = self.fetch_etherscan_transactions(wallet_address)
+        all_transactions = await self.fetch_etherscan_transactions(wallet_address)
         
         # Filter Compound transactions
         compound_transactions = self.filter_compound_transactions(all_transactions, wallet_address)
@@ -257,35 +322,42 @@ class CompoundDataFetcher:
         
         return wallet_data
     
-    async def fetch_multiple_wallets(self, wallet_addresses: List[str]) -> List[Dict]:
+    async def fetch_multiple_wallets(self, wallet_addresses: List[str], max_concurrency: int = 5) -> List[Dict]:
         """
-        Fetch data for multiple wallets with rate limiting
+        Fetch data for multiple wallets concurrently with rate limiting
         
         Args:
             wallet_addresses (List[str]): List of wallet addresses
+            max_concurrency (int): Maximum number of wallets fetched at once
             
         Returns:
             List[Dict]: Wallet data for all addresses
         """
-        wallet_data = []
+        if max_concurrency < 1:
+            raise ValueError(f"max_concurrency must be at least 1, got {max_concurrency}")
+        
+        semaphore = asyncio.Semaphore(max_concurrency)
+        completed = 0
+        
+        async def fetch_one(address: str) -> Optional[Dict]:
+            nonlocal completed
+            async with semaphore:
+                try:
+                    data = await self.fetch_wallet_data(address)
+                except Exception as e:
+                    logger.error(f"Error processing wallet {address}: {str(e)}")
+                    return None
+            
+            # Progress logging
+            completed += 1
+            if completed % 10 == 0:
+                logger.info(f"Processed {completed}/{len(wallet_addresses)} wallets")
+            
+            return data
         
-        for i, address in enumerate(wallet_addresses):
-            try:
-                data = await self.fetch_wallet_data(address)
-                wallet_data.append(data)
-                
-                # Progress logging
-                if (i + 1) % 10 == 0:
-                    logger.info(f"Processed {i + 1}/{len(wallet_addresses)} wallets")
-                
-                # Rate limiting
-                await asyncio.sleep(0.5)  # 2 requests per second max
-                
-            except Exception as e:
-                logger.error(f"Error processing wallet {address}: {str(e)}")
-                continue
+        results = await asyncio.gather(*(fetch_one(address) for address in wallet_addresses))
         
-        return wallet_data
+        return [data for data in results if data is not None]
     
     def load_wallet_addresses(self, file_path: str) -> List[str]:
         """
@@ -317,17 +389,75 @@ class CompoundDataFetcher:
             logger.error(f"Error loading wallet addresses: {str(e)}")
             return []
     
-    def save_raw_data(self, wallet_data: List[Dict], output_path: str):
+    def load_cached_wallets(self, wallet_addresses: List[str], cache_dir: str) -> Dict[str, Dict]:
         """
-        Save raw transaction data to JSON
+        Load raw transaction data for wallets present in the per-wallet cache
         
         Args:
-            wallet_data (List[Dict]): Wallet transaction data
-            output_path (str): Output file path
+            wallet_addresses (List[str]): List of wallet addresses
+            cache_dir (str): Directory holding one JSON file per wallet
+            
+        Returns:
+            Dict[str, Dict]: Cached wallet data keyed by address (misses omitted)
+        """
+        cached = {}
+        
+        for address in wallet_addresses:
+            cache_path = os.path.join(cache_dir, f"{address.lower()}.json")
+            try:
+                with open(cache_path, 'rb') as f:
+                    cached[address] = orjson.loads(f.read())
+            except FileNotFoundError:
+                continue
+            except Exception as e:
+                logger.error(f"Error loading cached data for {address}: {str(e)}")
+        
+        logger.info(f"Loaded {len(cached)}/{len(wallet_addresses)} wallets from cache")
+        return cached
+    
+    def migrate_raw_data(self, legacy_path: str, cache_dir: str):
+        """
+        Split a single-file raw data cache into the per-wallet cache
+        
+        Args:
+            legacy_path (str): JSON file holding a list of wallet data
+            cache_dir (str): Directory holding one JSON file per wallet
         """
+        # Created up front so an unreadable legacy file is only attempted once
+        os.makedirs(cache_dir, exist_ok=True)
+        
         try:
-            with open(output_path, 'w') as f:
-                json.dump(wallet_data, f, indent=2, default=str)
-            logger.info(f"Raw data saved to {output_path}")
+            with open(legacy_path, 'rb') as f:
+                wallet_data = orjson.loads(f.read())
         except Exception as e:
-            logger.error(f"Error saving raw data: {str(e)}")
+            logger.error(f"Error migrating raw data from {legacy_path}: {str(e)}")
+            return
+        
+        self.save_raw_data(wallet_data, cache_dir)
+        logger.info(f"Migrated {len(wallet_data)} wallets from {legacy_path} to {cache_dir}")
+    
+    def save_raw_data(self, wallet_data: List[Dict], cache_dir: str):
+        """
+        Save raw transaction data to the per-wallet JSON cache
+        
+        Only the given wallets are written, so a run that fetches a few new
+        wallets does not rewrite the whole cache.
+        
+        Args:
+            wallet_data (List[Dict]): Wallet transaction data
+            cache_dir (str): Directory holding one JSON file per wallet
+        """
+        os.makedirs(cache_dir, exist_ok=True)
+        
+        for data in wallet_data:
+            cache_path = os.path.join(cache_dir, f"{data['address'].lower()}.json")
+            try:
+                with open(cache_path, 'wb') as f:
+                    f.write(orjson.dumps(
+                        data,
+                        option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+                    ))
+            except Exception as e:
+                logger.error(f"Error saving raw data for {data['address']}: {str(e)}")
+        
+        logger.info(f"Raw data for {len(wallet_data)} wallets saved to {cache_dir}")
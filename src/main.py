@@ -1,8 +1,10 @@
 import asyncio
+import io
 import os
 import sys
 import argparse
-import json
+import orjson
+import numpy as np
 import pandas as pd
 import logging
 from pathlib import Path
@@ -27,6 +29,9 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+# Shared HTTP session so repeated downloads reuse the keep-alive connection
+_session = requests.Session()
+
 def create_directories():
     """Create necessary directories"""
     directories = ['data', 'results']
@@ -39,7 +44,7 @@ def download_wallet_list():
     sheet_url = "https://docs.google.com/spreadsheets/d/1ZzaeMgNYnxvriYYpe8PE7uMEblTI0GV5GIVUnsP-sBs/export?format=csv"
     
     try:
-        response = requests.get(sheet_url)
+        response = _session.get(sheet_url, timeout=30)
         response.raise_for_status()
         
         with open('data/wallet_addresses.csv', 'wb') as f:
@@ -66,6 +71,27 @@ def download_wallet_list():
         
         return 'data/wallet_addresses.csv'
 
+def extreme_positions(scores: np.ndarray, k: int, largest: bool) -> np.ndarray:
+    """Positions of the k highest (or lowest) scores, best first, without a full sort"""
+    k = min(k, len(scores))
+    if k == 0:
+        return np.array([], dtype=np.intp)
+    
+    keys = -scores if largest else scores
+    kth_key = np.partition(keys, k - 1)[k - 1]
+    
+    # Everything up to the kth value, ordered by score and then by position so
+    # ties resolve like nlargest/nsmallest(keep='first')
+    positions = np.flatnonzero(keys <= kth_key)
+    return positions[np.lexsort((positions, keys[positions]))][:k]
+
+def positive_int(value: str) -> int:
+    """argparse type for integer options that must be at least 1"""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
 async def main():
     """Main execution function"""
     parser = argparse.ArgumentParser(description='Compound Wallet Risk Scoring System')
@@ -73,6 +99,7 @@ async def main():
     parser.add_argument('--output', '-o', type=str, default='results/wallet_scores.csv', help='Output CSV file')
     parser.add_argument('--use-cache', action='store_true', help='Use cached data if available')
     parser.add_argument('--limit', type=int, help='Limit number of wallets to process')
+    parser.add_argument('--concurrency', type=positive_int, default=10, help='Maximum number of wallets fetched concurrently')
     
     args = parser.parse_args()
     
@@ -100,26 +127,54 @@ async def main():
         # Step 2: Fetch transaction data
         logger.info("=== Step 2: Fetching Transaction Data ===")
         
-        cache_file = 'data/raw_wallet_data.json'
+        cache_dir = 'data/wallet_cache'
+        legacy_cache_file = 'data/raw_wallet_data.json'
+        processed_file = 'data/processed_transactions.parquet'
         
-        if args.use_cache and os.path.exists(cache_file):
-            logger.info("Loading cached transaction data")
-            with open(cache_file, 'r') as f:
-                wallet_data = json.load(f)
-        else:
-            logger.info("Fetching fresh transaction data (this may take a while...)")
-            wallet_data = await fetcher.fetch_multiple_wallets(wallet_addresses)
-            
-            # Save raw data
-            fetcher.save_raw_data(wallet_data, cache_file)
-        
-        print(f"Fetched data for {len(wallet_data)} wallets")
+        processor = CompoundDataProcessor()
         
-        # Step 3: Process transaction data
-        logger.info("=== Step 3: Processing Transaction Data ===")
+        transaction_df = None
+        if args.use_cache and os.path.exists(processed_file):
+            # Typed columnar cache, skips re-parsing the raw JSON; only used
+            # when it was built for exactly this wallet set
+            logger.info("Loading cached processed transaction data")
+            transaction_df = processor.load_processed(processed_file, wallet_addresses)
+        
+        if transaction_df is None:
+            cached_data = {}
+            if args.use_cache:
+                # One-time import of the old single-file cache
+                if os.path.exists(legacy_cache_file) and not os.path.isdir(cache_dir):
+                    fetcher.migrate_raw_data(legacy_cache_file, cache_dir)
+                
+                logger.info("Loading cached transaction data")
+                cached_data = fetcher.load_cached_wallets(wallet_addresses, cache_dir)
+            
+            # Only wallets missing from the cache hit the API
+            missing_addresses = [address for address in wallet_addresses if address not in cached_data]
+            fetched_data = []
+            if missing_addresses:
+                logger.info(f"Fetching fresh transaction data for {len(missing_addresses)} wallets (this may take a while...)")
+                try:
+                    fetched_data = await fetcher.fetch_multiple_wallets(
+                        missing_addresses, max_concurrency=args.concurrency
+                    )
+                finally:
+                    await fetcher.close()
+                
+                # Save raw data
+                fetcher.save_raw_data(fetched_data, cache_dir)
+            
+            wallet_data = list(cached_data.values()) + fetched_data
+            
+            print(f"Fetched data for {len(wallet_data)} wallets")
+            
+            # Step 3: Process transaction data
+            logger.info("=== Step 3: Processing Transaction Data ===")
+            
+            transaction_df = processor.process_wallet_data(wallet_data)
+            processor.save_processed(transaction_df, processed_file, wallet_addresses)
         
-        processor = CompoundDataProcessor()
-        transaction_df = processor.process_wallet_data(wallet_data)
         wallet_metrics = processor.calculate_wallet_metrics(transaction_df)
         
         print(f"Processed {len(transaction_df)} transactions")
@@ -128,7 +183,7 @@ async def main():
         # Step 4: Risk analysis
         logger.info("=== Step 4: Analyzing Risk Patterns ===")
         
-        risk_analyzer = WalletRiskAnalyzer()
+        risk_analyzer = WalletRiskAnalyzer(use_cache=args.use_cache)
         risk_features = risk_analyzer.calculate_risk_features(wallet_metrics)
         anomaly_scores = risk_analyzer.detect_anomalies(risk_features)
         
@@ -144,7 +199,7 @@ async def main():
         logger.info("=== Step 6: Saving Results ===")
         
         # Primary output format
-        output_df = final_scores[['wallet_id', 'score']].copy()
+        output_df = final_scores[['wallet_id', 'score']]
         output_df.to_csv(args.output, index=False)
         
         # Detailed results
@@ -159,37 +214,47 @@ async def main():
         
         distribution = score_calculator.get_score_distribution()
         
-        print(f"\n=== RISK SCORING RESULTS ===")
-        print(f"Total wallets analyzed: {distribution['total_wallets']}")
-        print(f"Mean score: {distribution['mean_score']:.1f}")
-        print(f"Median score: {distribution['median_score']:.1f}")
-        print(f"Score range: {distribution['min_score']} - {distribution['max_score']}")
+        # Build the summary in memory and write it out once
+        summary = io.StringIO()
+        total_wallets = distribution['total_wallets']
+        
+        summary.write(f"\n=== RISK SCORING RESULTS ===\n")
+        summary.write(f"Total wallets analyzed: {total_wallets}\n")
+        summary.write(f"Mean score: {distribution['mean_score']:.1f}\n")
+        summary.write(f"Median score: {distribution['median_score']:.1f}\n")
+        summary.write(f"Score range: {distribution['min_score']} - {distribution['max_score']}\n")
         
-        print(f"\nScore Distribution:")
+        summary.write(f"\nScore Distribution:\n")
         for range_name, count in distribution['score_ranges'].items():
             if count > 0:
-                percentage = (count / distribution['total_wallets']) * 100
-                print(f"  {range_name}: {count} wallets ({percentage:.1f}%)")
+                percentage = (count / total_wallets) * 100
+                summary.write(f"  {range_name}: {count} wallets ({percentage:.1f}%)\n")
         
-        print(f"\nRisk Categories:")
+        summary.write(f"\nRisk Categories:\n")
         for category, count in distribution['risk_categories'].items():
-            percentage = (count / distribution['total_wallets']) * 100
-            print(f"  {category}: {count} wallets ({percentage:.1f}%)")
+            percentage = (count / total_wallets) * 100
+            summary.write(f"  {category}: {count} wallets ({percentage:.1f}%)\n")
         
         # Show top and bottom performers
-        print(f"\nTop 5 Highest Scoring Wallets:")
-        top_wallets = final_scores.nlargest(5, 'score')[['wallet_id', 'score', 'risk_category']]
-        for _, row in top_wallets.iterrows():
-            print(f"  {row['wallet_id']}: {row['score']} ({row['risk_category']})")
+        summary_columns = ['wallet_id', 'score', 'risk_category']
+        score_values = final_scores['score'].to_numpy()
+        
+        summary.write(f"\nTop 5 Highest Scoring Wallets:\n")
+        top_wallets = final_scores.iloc[extreme_positions(score_values, 5, largest=True)][summary_columns]
+        for row in top_wallets.itertuples(index=False):
+            summary.write(f"  {row.wallet_id}: {row.score} ({row.risk_category})\n")
+        
+        summary.write(f"\nTop 5 Lowest Scoring Wallets:\n")
+        bottom_wallets = final_scores.iloc[extreme_positions(score_values, 5, largest=False)][summary_columns]
+        for row in bottom_wallets.itertuples(index=False):
+            summary.write(f"  {row.wallet_id}: {row.score} ({row.risk_category})\n")
         
-        print(f"\nTop 5 Lowest Scoring Wallets:")
-        bottom_wallets = final_scores.nsmallest(5, 'score')[['wallet_id', 'score', 'risk_category']]
-        for _, row in bottom_wallets.iterrows():
-            print(f"  {row['wallet_id']}: {row['score']} ({row['risk_category']})")
+        sys.stdout.write(summary.getvalue())
         
         # Save analysis
-        with open('results/score_analysis.json', 'w') as f:
-            json.dump(distribution, f, indent=2, default=str)
+        Path('results/score_analysis.json').write_bytes(
+            orjson.dumps(distribution, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY)
+        )
         
         logger.info("Risk scoring analysis complete!")
         
@@ -1,22 +1,149 @@
 import pandas as pd
 import numpy as np
+from numba import njit, prange
+from joblib import Memory
 from sklearn.preprocessing import StandardScaler, MinMaxScaler
 from sklearn.cluster import KMeans
 from sklearn.ensemble import IsolationForest
 from typing import Dict, List, Tuple
+import hashlib
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Output order of the risk feature kernel
+RISK_SCORE_COLUMNS = [
+    'liquidation_risk_score', 'behavioral_risk_score', 'financial_health_score',
+    'activity_pattern_risk', 'repayment_behavior_score', 'experience_score',
+    'diversification_score', 'bot_behavior_score'
+]
+
+# Account age bins (days, right-closed) and their experience scores; ages
+# of 0 or less fall below the first bin and score 0
+AGE_BINS = np.array([0.0, 30.0, 90.0, 180.0, 365.0])
+AGE_SCORES = np.array([0.0, 0.1, 0.3, 0.5, 0.7, 1.0])
+
+@njit(parallel=True, cache=True)
+def _risk_feature_kernel(liquidation_count, liquidation_rate, has_liquidations, success_rate,
+                         activity_regularity, weekend_ratio, night_ratio, repay_to_borrow,
+                         action_diversity, account_age, avg_gas, daily_variance, max_daily,
+                         total_transactions, borrow_count, supply_ratio, withdraw_ratio,
+                         borrow_ratio, repay_ratio, regularity_q80, gas_q90, daily_variance_q80,
+                         max_daily_q90, total_transactions_q70, out):
+    """
+    Compute all eight raw risk scores (columns of out, in RISK_SCORE_COLUMNS
+    order) in one pass over the wallets; the caller clips them to 0-1. NaN
+    inputs fail every comparison, as with the equivalent pandas masks.
+    """
+    for i in prange(len(out)):
+        # 1. Liquidation risk (0-1, higher = more risky): direct events, rate, binary indicator
+        liquidation = liquidation_count[i] * 0.5 + liquidation_rate[i] * 0.3 + has_liquidations[i] * 0.2
+        
+        # 2. Behavioral risk (0-1, higher = more risky)
+        behavioral = (1 - success_rate[i]) * 0.3  # High failure rate
+        if activity_regularity[i] > regularity_q80:  # Irregular activity patterns
+            behavioral += 0.2
+        # Excessive weekend/night activity
+        behavioral += min(max(weekend_ratio[i] - 0.3, 0.0), 1.0) * 0.2
+        behavioral += min(max(night_ratio[i] - 0.2, 0.0), 1.0) * 0.3
+        
+        # 3. Financial health (0-1, higher = better health)
+        health = 1.0
+        if repay_to_borrow[i] < 0.8:  # Poor repayment behavior
+            health -= 0.4
+        if action_diversity[i] <= 2:  # Low transaction diversity
+            health -= 0.2
+        if account_age[i] < 30:  # Very new accounts
+            health -= 0.2
+        if avg_gas[i] > gas_q90:  # High gas spending relative to activity
+            health -= 0.2
+        
+        # 4. Activity pattern risk (0-1, higher = more risky)
+        activity = 0.0
+        if daily_variance[i] > daily_variance_q80:  # Burst activity
+            activity += 0.3
+        if max_daily[i] > max_daily_q90:  # Excessive daily transactions
+            activity += 0.4
+        if activity_regularity[i] < 0.1 and total_transactions[i] > 5:  # Very regular intervals
+            activity += 0.3
+        
+        # 5. Repayment behavior (0-1, higher = better)
+        repayment = 0.0
+        if repay_to_borrow[i] >= 1.0:  # Good repayment ratio
+            repayment += 0.5
+        elif repay_to_borrow[i] >= 0.8:  # Moderate repayment
+            repayment += 0.3
+        if not borrow_count[i] > 0:  # Neutral score for non-borrowers
+            repayment += 0.2
+        if liquidation_count[i] == 0:  # No liquidations
+            repayment += 0.3
+        
+        # 6. Experience/maturity (0-1, higher = more experienced): account age bins
+        experience = AGE_SCORES[np.searchsorted(AGE_BINS, account_age[i])]
+        if total_transactions[i] > total_transactions_q70:  # Transaction volume bonus
+            experience += 0.2
+        if activity_regularity[i] > 0.1 and activity_regularity[i] < 1.0:  # Consistent activity bonus
+            experience += 0.1
+        
+        # 7. Diversification (0-1, higher = more diversified): action diversity and balance
+        diversification = min(max(action_diversity[i] / 5, 0.0), 0.6)
+        top_ratio = max(max(supply_ratio[i], withdraw_ratio[i]), max(borrow_ratio[i], repay_ratio[i]))
+        diversification += (1 - top_ratio) * 0.4
+        
+        # 8. Bot-like behavior (0-1, higher = more bot-like)
+        bot = 0.0
+        if activity_regularity[i] < 0.05 and total_transactions[i] > 10:  # Very regular timing
+            bot += 0.4
+        if night_ratio[i] > 0.5:  # High night activity
+            bot += 0.3
+        if max_daily[i] > 50:  # Excessive transactions per day
+            bot += 0.3
+        
+        out[i, 0] = liquidation
+        out[i, 1] = behavioral
+        out[i, 2] = health
+        out[i, 3] = activity
+        out[i, 4] = repayment
+        out[i, 5] = experience
+        out[i, 6] = diversification
+        out[i, 7] = bot
+
+def _fit_anomaly_detector(X_hash: str, params: Dict, X: np.ndarray) -> Tuple[IsolationForest, np.ndarray]:
+    """
+    Fit an IsolationForest and score the same matrix
+    
+    Memoized on X_hash and params (X itself is excluded from the cache key).
+    
+    Args:
+        X_hash (str): Digest of X
+        params (Dict): IsolationForest parameters
+        X (np.ndarray): Scaled feature matrix
+        
+    Returns:
+        Tuple[IsolationForest, np.ndarray]: Fitted detector and decision scores for X
+    """
+    detector = IsolationForest(**params)
+    detector.fit(X)
+    return detector, detector.decision_function(X)
+
 class WalletRiskAnalyzer:
     """
     Analyze wallet risk patterns and generate risk indicators
     """
     
-    def __init__(self):
+    def __init__(self, use_cache: bool = False):
         self.risk_features = None
         self.scaler = StandardScaler()
-        self.anomaly_detector = IsolationForest(contamination=0.1, random_state=42)
+        self.anomaly_detector = IsolationForest(contamination=0.1, random_state=42, n_jobs=-1)
+        
+        # On-disk cache of fitted detectors (--use-cache runs only), keyed on the
+        # scaled input matrix and pruned to cache_bytes_limit after each fit
+        self.memory = None
+        self.cache_bytes_limit = 20 * 1024 * 1024
+        self._fit_anomaly_detector = _fit_anomaly_detector
+        if use_cache:
+            self.memory = Memory('data/.joblib_cache', verbose=0)
+            self._fit_anomaly_detector = self.memory.cache(_fit_anomaly_detector, ignore=['X'])
         
     def calculate_risk_features(self, wallet_metrics: pd.DataFrame) -> pd.DataFrame:
         """
@@ -30,190 +157,52 @@ class WalletRiskAnalyzer:
         """
         logger.info("Calculating risk features")
         
-        risk_features = wallet_metrics.copy()
-        
-        # 1. Liquidation Risk Score
-        risk_features['liquidation_risk_score'] = self._calculate_liquidation_risk(wallet_metrics)
-        
-        # 2. Behavioral Risk Score
-        risk_features['behavioral_risk_score'] = self._calculate_behavioral_risk(wallet_metrics)
-        
-        # 3. Financial Health Score
-        risk_features['financial_health_score'] = self._calculate_financial_health(wallet_metrics)
-        
-        # 4. Activity Pattern Risk
-        risk_features['activity_pattern_risk'] = self._calculate_activity_pattern_risk(wallet_metrics)
-        
-        # 5. Repayment Behavior Score
-        risk_features['repayment_behavior_score'] = self._calculate_repayment_behavior(wallet_metrics)
-        
-        # 6. Experience/Maturity Score
-        risk_features['experience_score'] = self._calculate_experience_score(wallet_metrics)
+        # Columns as contiguous float64 arrays for the kernel
+        cols = {
+            col: wallet_metrics[col].to_numpy(dtype=np.float64)
+            for col in [
+                'liquidation_count', 'liquidation_rate', 'has_liquidations', 'success_rate',
+                'activity_regularity', 'weekend_activity_ratio', 'night_activity_ratio',
+                'repay_to_borrow_ratio', 'action_diversity', 'account_age_days', 'avg_gas_per_tx',
+                'daily_activity_variance', 'max_daily_transactions', 'total_transactions',
+                'borrow_count', 'supply_ratio', 'withdraw_ratio', 'borrow_ratio', 'repay_ratio'
+            ]
+        }
+        
+        # Population thresholds from a single quantile call; the gas and
+        # daily-activity penalties only apply when some wallet has a positive value
+        quantiles = wallet_metrics[[
+            'activity_regularity', 'avg_gas_per_tx', 'daily_activity_variance',
+            'max_daily_transactions', 'total_transactions'
+        ]].quantile([0.7, 0.8, 0.9])
+        column_max = wallet_metrics[['avg_gas_per_tx', 'daily_activity_variance', 'max_daily_transactions']].max()
+        
+        def threshold(col: str, q: float, require_positive: bool = False) -> float:
+            if require_positive and not column_max[col] > 0:
+                return np.inf
+            return float(quantiles.at[q, col])
+        
+        scores = np.empty((len(wallet_metrics), len(RISK_SCORE_COLUMNS)))
+        _risk_feature_kernel(
+            *cols.values(),
+            threshold('activity_regularity', 0.8),
+            threshold('avg_gas_per_tx', 0.9, require_positive=True),
+            threshold('daily_activity_variance', 0.8, require_positive=True),
+            threshold('max_daily_transactions', 0.9, require_positive=True),
+            threshold('total_transactions', 0.7),
+            scores
+        )
         
-        # 7. Diversification Score
-        risk_features['diversification_score'] = self._calculate_diversification_score(wallet_metrics)
+        # All scores share the 0-1 range; clip the whole buffer in one pass
+        np.clip(scores, 0.0, 1.0, out=scores)
         
-        # 8. Bot-like Behavior Score
-        risk_features['bot_behavior_score'] = self._calculate_bot_behavior_score(wallet_metrics)
+        # Attach the scores to the metrics without duplicating the metrics frame
+        score_frame = pd.DataFrame(scores, columns=RISK_SCORE_COLUMNS, index=wallet_metrics.index)
+        risk_features = pd.concat([wallet_metrics, score_frame], axis=1, copy=False)
         
         self.risk_features = risk_features
         return risk_features
     
-    def _calculate_liquidation_risk(self, df: pd.DataFrame) -> pd.Series:
-        """Calculate liquidation-based risk score (0-1, higher = more risky)"""
-        liquidation_score = np.zeros(len(df))
-        
-        # Direct liquidation events
-        liquidation_score += df['liquidation_count'] * 0.5
-        
-        # Liquidation rate
-        liquidation_score += df['liquidation_rate'] * 0.3
-        
-        # Has liquidations (binary indicator)
-        liquidation_score += df['has_liquidations'] * 0.2
-        
-        # Normalize to 0-1 range
-        return np.clip(liquidation_score, 0, 1)
-    
-    def _calculate_behavioral_risk(self, df: pd.DataFrame) -> pd.Series:
-        """Calculate behavioral risk patterns (0-1, higher = more risky)"""
-        behavioral_score = np.zeros(len(df))
-        
-        # High failure rate
-        behavioral_score += (1 - df['success_rate']) * 0.3
-        
-        # Irregular activity patterns
-        high_variance_mask = df['activity_regularity'] > df['activity_regularity'].quantile(0.8)
-        behavioral_score[high_variance_mask] += 0.2
-        
-        # Excessive weekend/night activity
-        behavioral_score += np.clip(df['weekend_activity_ratio'] - 0.3, 0, 1) * 0.2
-        behavioral_score += np.clip(df['night_activity_ratio'] - 0.2, 0, 1) * 0.3
-        
-        return np.clip(behavioral_score, 0, 1)
-    
-    def _calculate_financial_health(self, df: pd.DataFrame) -> pd.Series:
-        """Calculate financial health score (0-1, higher = better health)"""
-        health_score = np.ones(len(df))  # Start with perfect health
-        
-        # Poor repayment behavior
-        poor_repayment_mask = df['repay_to_borrow_ratio'] < 0.8
-        health_score[poor_repayment_mask] -= 0.4
-        
-        # Low transaction diversity
-        low_diversity_mask = df['action_diversity'] <= 2
-        health_score[low_diversity_mask] -= 0.2
-        
-        # Very new accounts (less than 30 days)
-        new_account_mask = df['account_age_days'] < 30
-        health_score[new_account_mask] -= 0.2
-        
-        # High gas spending relative to activity (potential inefficiency)
-        if df['avg_gas_per_tx'].max() > 0:
-            high_gas_mask = df['avg_gas_per_tx'] > df['avg_gas_per_tx'].quantile(0.9)
-            health_score[high_gas_mask] -= 0.2
-        
-        return np.clip(health_score, 0, 1)
-    
-    def _calculate_activity_pattern_risk(self, df: pd.DataFrame) -> pd.Series:
-        """Calculate activity pattern risk (0-1, higher = more risky)"""
-        activity_risk = np.zeros(len(df))
-        
-        # Burst activity (high variance in daily transactions)
-        if df['daily_activity_variance'].max() > 0:
-            high_variance_mask = df['daily_activity_variance'] > df['daily_activity_variance'].quantile(0.8)
-            activity_risk[high_variance_mask] += 0.3
-        
-        # Excessive daily transactions
-        if df['max_daily_transactions'].max() > 0:
-            high_daily_mask = df['max_daily_transactions'] > df['max_daily_transactions'].quantile(0.9)
-            activity_risk[high_daily_mask] += 0.4
-        
-        # Very regular intervals (potential bot)
-        very_regular_mask = (df['activity_regularity'] < 0.1) & (df['total_transactions'] > 5)
-        activity_risk[very_regular_mask] += 0.3
-        
-        return np.clip(activity_risk, 0, 1)
-    
-    def _calculate_repayment_behavior(self, df: pd.DataFrame) -> pd.Series:
-        """Calculate repayment behavior score (0-1, higher = better)"""
-        repayment_score = np.zeros(len(df))
-        
-        # Good repayment ratio
-        good_repayment_mask = df['repay_to_borrow_ratio'] >= 1.0
-        repayment_score[good_repayment_mask] += 0.5
-        
-        # Moderate repayment
-        moderate_repayment_mask = (df['repay_to_borrow_ratio'] >= 0.8) & (df['repay_to_borrow_ratio'] < 1.0)
-        repayment_score[moderate_repayment_mask] += 0.3
-        
-        # Has borrowing activity (needed for repayment evaluation)
-        has_borrowing_mask = df['borrow_count'] > 0
-        repayment_score[~has_borrowing_mask] += 0.2  # Neutral score for non-borrowers
-        
-        # No liquidations
-        no_liquidation_mask = df['liquidation_count'] == 0
-        repayment_score[no_liquidation_mask] += 0.3
-        
-        return np.clip(repayment_score, 0, 1)
-    
-    def _calculate_experience_score(self, df: pd.DataFrame) -> pd.Series:
-        """Calculate experience/maturity score (0-1, higher = more experienced)"""
-        experience_score = np.zeros(len(df))
-        
-        # Account age scoring
-        age_bins = [0, 30, 90, 180, 365, float('inf')]
-        age_scores = [0.1, 0.3, 0.5, 0.7, 1.0]
-        
-        for i in range(len(age_bins) - 1):
-            mask = (df['account_age_days'] > age_bins[i]) & (df['account_age_days'] <= age_bins[i + 1])
-            experience_score[mask] = age_scores[i]
-        
-        # Transaction volume bonus
-        high_volume_mask = df['total_transactions'] > df['total_transactions'].quantile(0.7)
-        experience_score[high_volume_mask] += 0.2
-        
-        # Consistent activity bonus
-        consistent_activity_mask = (df['activity_regularity'] > 0.1) & (df['activity_regularity'] < 1.0)
-        experience_score[consistent_activity_mask] += 0.1
-        
-        return np.clip(experience_score, 0, 1)
-    
-    def _calculate_diversification_score(self, df: pd.DataFrame) -> pd.Series:
-        """Calculate diversification score (0-1, higher = more diversified)"""
-        diversification_score = np.zeros(len(df))
-        
-        # Action diversity scoring
-        diversification_score += np.clip(df['action_diversity'] / 5, 0, 0.6)
-        
-        # Balanced activity (not over-concentrated in one action)
-        balance_score = 1 - np.maximum.reduce([
-            df['supply_ratio'], df['withdraw_ratio'], 
-            df['borrow_ratio'], df['repay_ratio']
-        ])
-        diversification_score += balance_score * 0.4
-        
-        return np.clip(diversification_score, 0, 1)
-    
-    def _calculate_bot_behavior_score(self, df: pd.DataFrame) -> pd.Series:
-        """Calculate bot-like behavior score (0-1, higher = more bot-like)"""
-        bot_score = np.zeros(len(df))
-        
-        # Very regular timing
-        very_regular_mask = (df['activity_regularity'] < 0.05) & (df['total_transactions'] > 10)
-        bot_score[very_regular_mask] += 0.4
-        
-        # High night activity
-        high_night_mask = df['night_activity_ratio'] > 0.5
-        bot_score[high_night_mask] += 0.3
-        
-        # Excessive transactions per day
-        if df['max_daily_transactions'].max() > 0:
-            excessive_daily_mask = df['max_daily_transactions'] > 50
-            bot_score[excessive_daily_mask] += 0.3
-        
-        return np.clip(bot_score, 0, 1)
-    
     def detect_anomalies(self, risk_features: pd.DataFrame) -> pd.Series:
         """
         Detect anomalous wallets using isolation forest
@@ -240,15 +229,27 @@ class WalletRiskAnalyzer:
             logger.warning("No numerical features available for anomaly detection")
             return pd.Series(np.zeros(len(risk_features)), index=risk_features.index)
         
-        # Prepare data
-        X = risk_features[available_features].fillna(0)
+        # Prepare data as one contiguous float32 matrix (the tree dtype IsolationForest uses)
+        X = np.ascontiguousarray(risk_features[available_features].to_numpy(dtype=np.float32))
+        np.nan_to_num(X, copy=False, nan=0.0)
         
         # Scale features
         X_scaled = self.scaler.fit_transform(X)
         
-        # Detect anomalies
-        anomaly_scores = self.anomaly_detector.fit_predict(X_scaled)
-        anomaly_decision_scores = self.anomaly_detector.decision_function(X_scaled)
+        # Detect anomalies; with the cache on, the fit is reused when the same
+        # matrix was seen before. Scores are labelled the way predict() does
+        X_hash = None
+        if self.memory is not None:
+            # X is excluded from the cache key, so shape and dtype go into the digest
+            digest = hashlib.blake2b(f"{X_scaled.shape}:{X_scaled.dtype}".encode())
+            digest.update(np.ascontiguousarray(X_scaled).tobytes())
+            X_hash = digest.hexdigest()
+        self.anomaly_detector, anomaly_decision_scores = self._fit_anomaly_detector(
+            X_hash, self.anomaly_detector.get_params(), X_scaled
+        )
+        if self.memory is not None:
+            self.memory.reduce_size(bytes_limit=self.cache_bytes_limit)
+        anomaly_scores = np.where(anomaly_decision_scores < 0, -1, 1)
         
         # Normalize decision scores to 0-1 range (higher = less anomalous)
         normalized_scores = (anomaly_decision_scores - anomaly_decision_scores.min()) / (
@@ -12,6 +12,7 @@ class RiskScoreCalculator:
     
     def __init__(self):
         self.scores = None
+        self._wallet_index = None
         self.weights = {
             'liquidation_risk': 0.25,
             'behavioral_risk': 0.15,
@@ -35,43 +36,61 @@ class RiskScoreCalculator:
         """
         logger.info("Calculating final risk scores")
         
-        scores_df = pd.DataFrame(index=risk_features.index)
-        scores_df['wallet_id'] = risk_features['wallet_address']
+        def column(name: str) -> np.ndarray:
+            # Missing feature columns fall back to zeros
+            if name in risk_features.columns:
+                return risk_features[name].to_numpy()
+            return np.zeros(len(risk_features))
         
         # Calculate composite risk score
-        composite_score = self._calculate_composite_score(risk_features)
+        composite_score = self._calculate_composite_score(risk_features).to_numpy()
+        anomaly_values = anomaly_scores.to_numpy()
         
         # Incorporate anomaly scores
-        anomaly_adjustment = (1 - anomaly_scores) * 0.1  # Anomalies reduce score
+        anomaly_adjustment = (1 - anomaly_values) * 0.1  # Anomalies reduce score
         
         # Final score calculation
         # Lower risk = higher score
-        final_risk_score = composite_score - anomaly_adjustment
-        final_risk_score = np.clip(final_risk_score, 0, 1)
+        final_risk_score = np.clip(composite_score - anomaly_adjustment, 0, 1)
         
         # Convert risk score to credit score (inverse relationship)
         # Risk score 0 (lowest risk) = Credit score 1000
         # Risk score 1 (highest risk) = Credit score 0
         credit_scores = (1 - final_risk_score) * 1000
         
-        scores_df['score'] = credit_scores.round(0).astype(int)
-        scores_df['risk_category'] = self._categorize_risk(credit_scores)
+        # NaN would silently wrap to INT32_MIN in the cast below
+        if not np.isfinite(credit_scores).all():
+            raise ValueError("Cannot convert non-finite risk scores to credit scores")
         
-        # Add component scores for transparency
-        scores_df['liquidation_risk_component'] = risk_features.get('liquidation_risk_score', 0)
-        scores_df['behavioral_risk_component'] = risk_features.get('behavioral_risk_score', 0)
-        scores_df['financial_health_component'] = risk_features.get('financial_health_score', 0)
-        scores_df['repayment_behavior_component'] = risk_features.get('repayment_behavior_score', 0)
-        scores_df['experience_component'] = risk_features.get('experience_score', 0)
-        scores_df['anomaly_score'] = anomaly_scores
-        
-        # Additional metrics for analysis
-        scores_df['total_transactions'] = risk_features.get('total_transactions', 0)
-        scores_df['account_age_days'] = risk_features.get('account_age_days', 0)
-        scores_df['liquidation_count'] = risk_features.get('liquidation_count', 0)
-        scores_df['success_rate'] = risk_features.get('success_rate', 0)
+        # Build the frame in one go rather than column by column
+        scores_df = pd.DataFrame({
+            'wallet_id': risk_features['wallet_address'].to_numpy(),
+            'score': credit_scores.round(0).astype(np.int32),
+            'risk_category': self._categorize_risk(credit_scores),
+            
+            # Component scores for transparency
+            'liquidation_risk_component': column('liquidation_risk_score'),
+            'behavioral_risk_component': column('behavioral_risk_score'),
+            'financial_health_component': column('financial_health_score'),
+            'repayment_behavior_component': column('repayment_behavior_score'),
+            'experience_component': column('experience_score'),
+            'anomaly_score': anomaly_values,
+            
+            # Additional metrics for analysis
+            'total_transactions': column('total_transactions'),
+            'account_age_days': column('account_age_days'),
+            'liquidation_count': column('liquidation_count'),
+            'success_rate': column('success_rate'),
+        }, index=risk_features.index)
         
         self.scores = scores_df
+        
+        # Lowercased wallet id -> row position for explain_score (first row wins on duplicates)
+        wallet_keys = scores_df['wallet_id'].str.lower()
+        keep = ~wallet_keys.duplicated(keep='first').to_numpy()
+        self._wallet_index = pd.Series(
+            np.arange(len(scores_df))[keep], index=wallet_keys.to_numpy()[keep]
+        )
         logger.info(f"Calculated scores for {len(scores_df)} wallets")
         
         return scores_df
@@ -86,31 +105,29 @@ class RiskScoreCalculator:
         Returns:
             pd.Series: Composite risk scores (0-1, higher = more risky)
         """
-        composite_score = np.zeros(len(risk_features))
-        
-        # Risk components (higher values = more risky)
-        risk_components = {
-            'liquidation_risk_score': self.weights['liquidation_risk'],
-            'behavioral_risk_score': self.weights['behavioral_risk'],
-            'activity_pattern_risk': self.weights['activity_pattern_risk']
-        }
-        
-        for component, weight in risk_components.items():
-            if component in risk_features.columns:
-                composite_score += risk_features[component].fillna(0) * weight
-        
-        # Positive components (higher values = lower risk, so we subtract from 1)
-        positive_components = {
-            'financial_health_score': self.weights['financial_health'],
-            'repayment_behavior_score': self.weights['repayment_behavior'],
-            'experience_score': self.weights['experience'],
-            'diversification_score': self.weights['diversification']
-        }
-        
-        for component, weight in positive_components.items():
-            if component in risk_features.columns:
-                # Invert positive scores (1 - score) to make them risk indicators
-                composite_score += (1 - risk_features[component].fillna(0)) * weight
+        # (column, weight key, sign): risk components (higher values = more risky)
+        # count as-is, positive components (higher values = lower risk) are
+        # inverted to (1 - score)
+        components = [
+            ('liquidation_risk_score', 'liquidation_risk', 1.0),
+            ('behavioral_risk_score', 'behavioral_risk', 1.0),
+            ('activity_pattern_risk', 'activity_pattern_risk', 1.0),
+            ('financial_health_score', 'financial_health', -1.0),
+            ('repayment_behavior_score', 'repayment_behavior', -1.0),
+            ('experience_score', 'experience', -1.0),
+            ('diversification_score', 'diversification', -1.0)
+        ]
+        
+        # Components missing from the features contribute nothing
+        present = [component for component in components if component[0] in risk_features.columns]
+        columns = [column for column, _, _ in present]
+        weights = np.array([self.weights[key] for _, key, _ in present], dtype=np.float64)
+        signs = np.array([sign for _, _, sign in present], dtype=np.float64)
+        
+        # sum(w * x) over risk components + sum(w * (1 - x)) over positive ones
+        # == (M * signs) @ w + sum of positive-component weights
+        M = risk_features[columns].fillna(0).to_numpy(dtype=np.float64)
+        composite_score = (M * signs) @ weights + weights[signs < 0].sum()
         
         return pd.Series(np.clip(composite_score, 0, 1), index=risk_features.index)
     
@@ -124,20 +141,13 @@ class RiskScoreCalculator:
         Returns:
             List[str]: Risk categories
         """
-        categories = []
-        for score in scores:
-            if score >= 800:
-                categories.append('Low Risk')
-            elif score >= 600:
-                categories.append('Medium-Low Risk')
-            elif score >= 400:
-                categories.append('Medium Risk')
-            elif score >= 200:
-                categories.append('High Risk')
-            else:
-                categories.append('Very High Risk')
-        
-        return categories
+        # Lower bounds of each category above 'Very High Risk'
+        bins = np.array([200, 400, 600, 800])
+        labels = np.array(['Very High Risk', 'High Risk', 'Medium Risk', 'Medium-Low Risk', 'Low Risk'])
+        
+        idx = np.searchsorted(bins, np.asarray(scores), side='right')
+        
+        return labels[idx].tolist()
     
     def get_score_distribution(self) -> Dict:
         """
@@ -151,6 +161,10 @@ class RiskScoreCalculator:
         
         scores = self.scores['score']
         
+        # Ten 100-point bins; np.histogram closes the last one, so 1000 counts in 900-1000
+        bin_edges = np.arange(0, 1001, 100)
+        range_counts, _ = np.histogram(scores.to_numpy(), bins=bin_edges)
+        
         distribution = {
             'total_wallets': len(scores),
             'mean_score': float(scores.mean()),
@@ -159,16 +173,7 @@ class RiskScoreCalculator:
             'min_score': int(scores.min()),
             'max_score': int(scores.max()),
             'score_ranges': {
-                '0-100': len(scores[(scores >= 0) & (scores < 100)]),
-                '100-200': len(scores[(scores >= 100) & (scores < 200)]),
-                '200-300': len(scores[(scores >= 200) & (scores < 300)]),
-                '300-400': len(scores[(scores >= 300) & (scores < 400)]),
-                '400-500': len(scores[(scores >= 400) & (scores < 500)]),
-                '500-600': len(scores[(scores >= 500) & (scores < 600)]),
-                '600-700': len(scores[(scores >= 600) & (scores < 700)]),
-                '700-800': len(scores[(scores >= 700) & (scores < 800)]),
-                '800-900': len(scores[(scores >= 800) & (scores < 900)]),
-                '900-1000': len(scores[(scores >= 900) & (scores <= 1000)])
+                f'{low}-{low + 100}': int(count) for low, count in zip(bin_edges[:-1], range_counts)
             },
             'risk_categories': self.scores['risk_category'].value_counts().to_dict()
         }
@@ -188,12 +193,12 @@ class RiskScoreCalculator:
         if self.scores is None:
             raise ValueError("Scores must be calculated first")
         
-        wallet_data = self.scores[self.scores['wallet_id'] == wallet_address.lower()]
+        position = self._wallet_index.get(wallet_address.lower())
         
-        if len(wallet_data) == 0:
+        if position is None:
             raise ValueError(f"Wallet {wallet_address} not found")
         
-        wallet_data = wallet_data.iloc[0]
+        wallet_data = self.scores.iloc[position]
         
         explanation = {
             'wallet_id': wallet_address,